@@ -1,12 +1,11 @@
 import cocotb
 import random
-import ipdb
 import numpy as np
-from cocotb.triggers import Timer, RisingEdge
+from cocotb.clock import Clock
+from cocotb.triggers import RisingEdge, ClockCycles
 import distproc.command_gen as cg
 
 CLK_CYCLE = 5
-N_CLKS = 500
 
 MEM_READ_LATENCY = 3
 RESET_LATENCY = 1
@@ -18,24 +17,72 @@ COND_JUMP_INSTR_TIME = ALU_INSTR_TIME + MEM_READ_LATENCY
 JUMP_INSTR_TIME = 2 + MEM_READ_LATENCY
 CSTROBE_DELAY = 2
 
-async def generate_clock(dut):
-    for i in range(N_CLKS):
-        dut.clk.value = 0
-        await Timer(CLK_CYCLE, units='ns')
-        dut.clk.value = 1
-        await Timer(CLK_CYCLE, units='ns')
-    dut._log.debug("clk cycle {}".format(i))
-
-async def load_commands(dut, cmd_list, start_addr=0):
-    addr = start_addr
-    for cmd in cmd_list:
-        dut.cmd_write.value = cmd
-        dut.cmd_write_addr.value = addr
-        dut.cmd_write_enable.value = 1
-        await RisingEdge(dut.clk)
-        addr += 1
+MEM_TO_CMD = 4
+MEM_WIDTH = 32
+CMD_WRITE_SETTLE_CYCLES = MEM_READ_LATENCY # write port: cycles after deasserting cmd_write_enable before the last word reads back
+
+def preload_commands(dut, cmd_list, start_addr=0):
+    """
+    Backdoor load of cmd_list directly into the command memory arrays
+    (no sim time). Returns False if the memory handles (cmd_mem_bank[i].mem.data
+    in toplevel_sim) aren't visible to the simulator, in which case nothing is written.
+    """
+    try:
+        mem_banks = [dut.cmd_mem_bank[i].mem.data for i in range(MEM_TO_CMD)]
+    except AttributeError:
+        dut._log.warning('cmd_mem_bank[i].mem.data not found; loading commands through the write port')
+        return False
+
+    word_mask = (1 << MEM_WIDTH) - 1
+    for addr, cmd in enumerate(cmd_list, start_addr):
+        for i, bank in enumerate(mem_banks):
+            bank[addr].setimmediatevalue((cmd >> (MEM_WIDTH*i)) & word_mask)
+
+    dut._log.info('preloaded {} commands through cmd_mem_bank backdoor'.format(len(cmd_list)))
+    return True
+
+async def load_commands(dut, cmd_list, start_addr=0, backdoor=True):
+    """
+    Load cmd_list into command memory, through the backdoor if possible (and
+    backdoor=True). Otherwise write one command per clock through the write port, 
+    then wait CMD_WRITE_SETTLE_CYCLES after deasserting cmd_write_enable.
+    """
+    if backdoor and preload_commands(dut, cmd_list, start_addr):
+        return
+
+    cmd_write = dut.cmd_write
+    cmd_write_addr = dut.cmd_write_addr
+    clk_edge = RisingEdge(dut.clk)
+
+    dut.cmd_write_enable.value = 1
+    for addr, cmd in enumerate(cmd_list, start_addr):
+        cmd_write.value = cmd
+        cmd_write_addr.value = addr
+        await clk_edge
 
     dut.cmd_write_enable.value = 0
+    await ClockCycles(dut.clk, CMD_WRITE_SETTLE_CYCLES)
+    dut._log.info('loaded {} commands through the write port'.format(len(cmd_list)))
+
+@cocotb.test()
+async def cmd_mem_write_port_test(dut):
+    """
+    load commands through the write port (the load_commands fallback) and 
+    check them against the memory contents
+    """
+    n_cmd = 8
+    rng = np.random.default_rng()
+    halves = rng.integers(0, 1 << 64, size=(n_cmd, 2), dtype=np.uint64)
+    cmd_list = [(int(hi) << 64) | int(lo) for lo, hi in halves]
+
+    cocotb.start_soon(Clock(dut.clk, 2*CLK_CYCLE, units='ns').start())
+    await load_commands(dut, cmd_list, backdoor=False)
+
+    word_mask = (1 << MEM_WIDTH) - 1
+    for i in range(MEM_TO_CMD):
+        mem = dut.cmd_mem_bank[i].mem.data
+        for addr, cmd in enumerate(cmd_list):
+            assert mem[addr].value.integer == (cmd >> (MEM_WIDTH*i)) & word_mask
 
 @cocotb.test()
 async def cmd_mem_out_test(dut):
@@ -46,73 +93,69 @@ async def cmd_mem_out_test(dut):
     make sure execution doesn't stop
     """
     n_cmd = 20
-    cmd_list = []
 
-    for i in range(n_cmd):
-        cmd_list.append(random.randint(0,2**120-1) + (1<<124))
+    #random 120 bit body (two 64 bit halves) w/ opcode 00001
+    rng = np.random.default_rng()
+    halves = rng.integers(0, 1 << 64, size=(n_cmd, 2), dtype=np.uint64)
+    halves[:, 1] &= np.uint64((1 << 56) - 1)
+    halves[:, 1] |= np.uint64(1 << 60)
+    cmd_list = [(int(hi) << 64) | int(lo) for lo, hi in halves]
     
-    await cocotb.start(generate_clock(dut))
+    cocotb.start_soon(Clock(dut.clk, 2*CLK_CYCLE, units='ns').start())
 
     await load_commands(dut, cmd_list)
     dut.reset.value = 1
-    await RisingEdge(dut.clk)
-    await RisingEdge(dut.clk)
+    await ClockCycles(dut.clk, 2)
     dut.reset.value = 0
-    for i in range(MEM_READ_LATENCY + RESET_LATENCY):
-        await RisingEdge(dut.clk)
+    await ClockCycles(dut.clk, MEM_READ_LATENCY + RESET_LATENCY)
 
     cmd_read_list = []
     qclk_val = []
+    cmd_buf_out = dut.dpr.cmd_buf_out
+    qclk_out = dut.dpr.qclk_out
     for i in range(n_cmd):
-        cmd_read_list.append(dut.dpr.cmd_buf_out.value)
-        qclk_val.append(dut.dpr.qclk_out.value)
-        #print('i ' + str(i))
-        #print('qclk_val ' + str(dut.qclk_out))
-        #print('qclk_rst ' + str(dut.myclk.rst))
-        for j in range(ALU_INSTR_TIME):
-            await RisingEdge(dut.clk)
+        cmd_read_list.append(cmd_buf_out.value)
+        qclk_val.append(qclk_out.value)
+        await ClockCycles(dut.clk, ALU_INSTR_TIME)
 
     for i in range(n_cmd):
         dut._log.debug('cmd_in {}'.format(int(cmd_list[i])))
-        dut._log.debug('cmd_out {}'.format(int(cmd_read_list[i])))
+        dut._log.debug('cmd_out {}'.format(cmd_read_list[i].integer))
         dut._log.debug('qclk: {}'.format(qclk_val[i]))
         dut._log.debug ('..........................')
-        assert hex(int(cmd_read_list[i])) == hex(cmd_list[i])
-
-    #dut._log.info("clk val {}".format(dut.clk))
+        assert hex(cmd_read_list[i].integer) == hex(cmd_list[i])
 
 @cocotb.test()
 async def pulse_freq_trig_test(dut):
     """
     run a series of commands to write freq val to cmd reg, then clock them out
     """
-    cmd_list = []
-    freq_word_list = []
     pulse_time_list = [3, 6, 11, 15, 18, 22]
     n_cmd = len(pulse_time_list)
     pulse_i_opcode = 0b10010000
 
-    for i in range(n_cmd):
-        freq_word = random.randint(0, 2**9 - 1)
-        freq_word_list.append(freq_word)
-        cmd_list.append((pulse_i_opcode << 120) + ((freq_word + 2**10) << 60) + (pulse_time_list[i] << (5)))
+    freq_word_list = [random.getrandbits(9) for i in range(n_cmd)]
+    cmd_list = [(pulse_i_opcode << 120) | ((freq_word | 1 << 10) << 60) | (pulse_time << 5)
+                for freq_word, pulse_time in zip(freq_word_list, pulse_time_list)]
     
-    await cocotb.start(generate_clock(dut))
+    cocotb.start_soon(Clock(dut.clk, 2*CLK_CYCLE, units='ns').start())
+    clk_edge = RisingEdge(dut.clk)
     await load_commands(dut, cmd_list)
     dut.reset.value = 1
-    await RisingEdge(dut.clk)
-    await RisingEdge(dut.clk)
+    await ClockCycles(dut.clk, 2)
     dut.reset.value = 0
-    for i in range(QCLK_RST_DELAY + RESET_LATENCY):
-        await RisingEdge(dut.clk)
+    await ClockCycles(dut.clk, QCLK_RST_DELAY + RESET_LATENCY)
 
     freq_read_list = []
     freq_read_times = []
+    qclk_out = dut.dpr.qclk_out
+    cstrobe_out = dut.cstrobe_out
+    freq_out = dut.freq
     for i in range(26):
-        if(dut.cstrobe_out.value == 1):
-            freq_read_list.append(dut.freq.value)
-            freq_read_times.append(dut.dpr.qclk_out.value)
-        await RisingEdge(dut.clk)
+        if(cstrobe_out.value == 1):
+            freq_read_list.append(freq_out.value)
+            freq_read_times.append(qclk_out.value)
+        await clk_edge
 
     dut._log.debug('command in: {}'.format(freq_word_list))
     dut._log.debug('command time in: {}'.format(pulse_time_list))
@@ -121,8 +164,6 @@ async def pulse_freq_trig_test(dut):
     for i in range(n_cmd):
         assert freq_word_list[i] == freq_read_list[i]
         assert pulse_time_list[i] == freq_read_times[i] - CSTROBE_DELAY
-    #assert np.all(np.asarray(cmd_body_list) == np.asarray(cmd_read_list).astype(int))
-    #assert np.all(np.asarray(cmd_time_list) == np.asarray(cmd_read_times).astype(int))
 
 @cocotb.test()
 async def pulse_i_test(dut):
@@ -144,27 +185,31 @@ async def pulse_i_test(dut):
         env_word_list.append(env_word)
         cmd_list.append(cg.pulse_i(freq_word, phase_word, amp_word, env_word, cfg_word, pulse_time_list[i]))
     
-    await cocotb.start(generate_clock(dut))
+    cocotb.start_soon(Clock(dut.clk, 2*CLK_CYCLE, units='ns').start())
+    clk_edge = RisingEdge(dut.clk)
     await load_commands(dut, cmd_list)
     dut.reset.value = 1
-    await RisingEdge(dut.clk)
-    await RisingEdge(dut.clk)
+    await ClockCycles(dut.clk, 2)
     dut.reset.value = 0
-    await RisingEdge(dut.clk)
-    await RisingEdge(dut.clk)
+    await ClockCycles(dut.clk, 2)
 
     freq_read_list = []
     phase_read_list = []
     env_read_list = []
     pulse_read_times = []
 
+    qclk_out = dut.dpr.qclk_out
+    cstrobe_out = dut.cstrobe_out
+    freq_out = dut.freq
+    phase_out = dut.phase
+    env_word_out = dut.env_word
     for i in range(30):
-        if(dut.cstrobe_out.value == 1):
-            freq_read_list.append(dut.freq.value)
-            phase_read_list.append(dut.phase.value)
-            env_read_list.append(dut.env_word.value)
-            pulse_read_times.append(dut.dpr.qclk_out.value)
-        await RisingEdge(dut.clk)
+        if(cstrobe_out.value == 1):
+            freq_read_list.append(freq_out.value)
+            phase_read_list.append(phase_out.value)
+            env_read_list.append(env_word_out.value)
+            pulse_read_times.append(qclk_out.value)
+        await clk_edge
 
     for i in range(n_cmd):
         assert freq_word_list[i] == freq_read_list[i]
@@ -179,15 +224,13 @@ async def regwrite_i_test(dut):
 
     cmd = (0b00010000 << 120) + (reg_val << 88) + (reg_addr << 80)
 
-    await cocotb.start(generate_clock(dut))
+    cocotb.start_soon(Clock(dut.clk, 2*CLK_CYCLE, units='ns').start())
     await load_commands(dut, [cmd])
 
     dut.reset.value = 1
-    await RisingEdge(dut.clk)
-    await RisingEdge(dut.clk)
+    await ClockCycles(dut.clk, 2)
     dut.reset.value = 0
-    for i in range(MEM_READ_LATENCY + ALU_INSTR_TIME + RESET_LATENCY):
-        await RisingEdge(dut.clk)
+    await ClockCycles(dut.clk, MEM_READ_LATENCY + ALU_INSTR_TIME + RESET_LATENCY)
 
     reg_read = dut.dpr.regs.data[reg_addr].value
 
@@ -200,35 +243,38 @@ async def reg_i_test(dut):
     on that register and an intermediate value, and store in another register. 
     Try this 100 times w/ random values and ops.
     """
-    for i in range(100):
+    cocotb.start_soon(Clock(dut.clk, 2*CLK_CYCLE, units='ns').start())
+    regs = dut.dpr.regs.data
+
+    #draw all test cases and evaluate expected outputs up front
+    n_iter = 100
+    rng = np.random.default_rng()
+    reg_addr0s = rng.integers(0, 16, n_iter)
+    reg_addr1s = rng.integers(0, 16, n_iter)
+    reg_vals = rng.integers(-2**31, 2**31, n_iter)
+    ivals = rng.integers(-2**31, 2**31, n_iter)
+    ops = np.array(['add', 'sub', 'le', 'ge', 'eq'])[rng.integers(0, 5, n_iter)]
+    correct_vals = np.select([ops == 'add', ops == 'sub', ops == 'le', ops == 'ge', ops == 'eq'],
+                             [(ivals + reg_vals) % 2**32, (ivals - reg_vals) % 2**32,
+                              ivals < reg_vals, ivals > reg_vals, ivals == reg_vals])
+
+    for reg_addr0, reg_addr1, reg_val, ival, op, correct_val in zip(reg_addr0s.tolist(), reg_addr1s.tolist(),
+            reg_vals.tolist(), ivals.tolist(), ops.tolist(), correct_vals.tolist()):
         cmd_list = []
-        reg_addr0 = random.randint(0,15)
-        reg_addr1 = random.randint(0,15)
-        #reg_val = random.randint(0, 2**32-1)
-        #ival = random.randint(0, 2**32-1)
-        reg_val = random.randint(-2**31, 2**31-1)
-        ival = random.randint(-2**31, 2**31-1)
-        op = random.choice(['add', 'sub', 'le', 'ge', 'eq'])
-        
         cmd_list.append(cg.alu_cmd('reg_alu', 'i', reg_val, 'id0', 0, reg_addr0))
         cmd_list.append(cg.alu_cmd('reg_alu', 'i', ival, op, reg_addr0, reg_addr1))
 
         dut._log.debug('cmd 0 in: {}'.format(bin(cmd_list[0])))
         dut._log.debug('cmd 1 in: {}'.format(bin(cmd_list[1])))
 
-        await cocotb.start(generate_clock(dut))
         await load_commands(dut, cmd_list)
 
         dut.reset.value = 1
-        await RisingEdge(dut.clk)
-        await RisingEdge(dut.clk)
+        await ClockCycles(dut.clk, 2)
         dut.reset.value = 0
-        for i in range(MEM_READ_LATENCY + 2*ALU_INSTR_TIME + RESET_LATENCY):
-            await RisingEdge(dut.clk)
-
-        reg_read_val = dut.dpr.regs.data[reg_addr1].value
+        await ClockCycles(dut.clk, MEM_READ_LATENCY + 2*ALU_INSTR_TIME + RESET_LATENCY)
 
-        correct_val = int(evaluate_alu_exp(ival, op, reg_val))
+        reg_read_val = regs[reg_addr1].value
 
         dut._log.debug('reg val in: {}'.format(reg_val))
         dut._log.debug('i val in: {}'.format(ival))
@@ -283,14 +329,13 @@ async def pulse_reg_test(dut):
         env_word_list.append(env_word)
         cfg_word_list.append(cfg_word)
     
-    await cocotb.start(generate_clock(dut))
+    cocotb.start_soon(Clock(dut.clk, 2*CLK_CYCLE, units='ns').start())
+    clk_edge = RisingEdge(dut.clk)
     await load_commands(dut, cmd_list)
     dut.reset.value = 1
-    await RisingEdge(dut.clk)
-    await RisingEdge(dut.clk)
+    await ClockCycles(dut.clk, 2)
     dut.reset.value = 0
-    for i in range(MEM_READ_LATENCY + RESET_LATENCY):
-        await RisingEdge(dut.clk)
+    await ClockCycles(dut.clk, MEM_READ_LATENCY + RESET_LATENCY)
 
     freq_read_list = []
     phase_read_list = []
@@ -299,15 +344,22 @@ async def pulse_reg_test(dut):
     env_read_list = []
     pulse_read_times = []
 
+    qclk_out = dut.dpr.qclk_out
+    cstrobe_out = dut.cstrobe_out
+    freq_out = dut.freq
+    phase_out = dut.phase
+    amp_out = dut.amp
+    env_word_out = dut.env_word
+    cfg_out = dut.cfg
     for i in range(25):
-        if(dut.cstrobe_out.value == 1):
-            freq_read_list.append(dut.freq.value)
-            phase_read_list.append(dut.phase.value)
-            amp_read_list.append(dut.amp.value)
-            env_read_list.append(dut.env_word.value)
-            cfg_read_list.append(dut.cfg.value)
-            pulse_read_times.append(dut.dpr.qclk_out.value)
-        await RisingEdge(dut.clk)
+        if(cstrobe_out.value == 1):
+            freq_read_list.append(freq_out.value)
+            phase_read_list.append(phase_out.value)
+            amp_read_list.append(amp_out.value)
+            env_read_list.append(env_word_out.value)
+            cfg_read_list.append(cfg_out.value)
+            pulse_read_times.append(qclk_out.value)
+        await clk_edge
 
     for i in range(n_cmd):
         assert freq_word_list[i] == freq_read_list[i]
@@ -322,17 +374,15 @@ async def jump_i_test(dut):
     cmd_list = []
     jump_addr = random.randint(0, 2**8-1)
     cmd_list.append(cg.jump_i(jump_addr))
-    for i in range(1, 2**8):
-        cmd_list.append(random.randint(0,2**32))
-    await cocotb.start(generate_clock(dut))
+    rng = np.random.default_rng()
+    cmd_list.extend(rng.integers(0, 1 << 32, size=2**8 - 1).tolist())
+    cocotb.start_soon(Clock(dut.clk, 2*CLK_CYCLE, units='ns').start())
     await load_commands(dut, cmd_list)
 
     dut.reset.value = 1
-    await RisingEdge(dut.clk)
-    await RisingEdge(dut.clk)
+    await ClockCycles(dut.clk, 2)
     dut.reset.value = 0
-    for i in range(MEM_READ_LATENCY + JUMP_INSTR_TIME):
-        await RisingEdge(dut.clk)
+    await ClockCycles(dut.clk, MEM_READ_LATENCY + JUMP_INSTR_TIME)
 
     read_command = dut.dpr.cmd_buf_out.value
 
@@ -356,18 +406,16 @@ async def jump_i_cond_test(dut):
     cmd_list.append(cg.alu_cmd('reg_alu', 'i', reg_val, 'id0', 0, reg_addr0))
     cmd_list.append(cg.alu_cmd('jump_cond', 'i', ival, op, reg_addr0, jump_cmd_ptr=jump_addr))
 
-    for i in range(2, 2**8):
-        cmd_list.append(random.randint(0,2**32))
+    rng = np.random.default_rng()
+    cmd_list.extend(rng.integers(0, 1 << 32, size=2**8 - 2).tolist())
 
-    await cocotb.start(generate_clock(dut))
+    cocotb.start_soon(Clock(dut.clk, 2*CLK_CYCLE, units='ns').start())
     await load_commands(dut, cmd_list)
 
     dut.reset.value = 1
-    await RisingEdge(dut.clk)
-    await RisingEdge(dut.clk)
+    await ClockCycles(dut.clk, 2)
     dut.reset.value = 0
-    for i in range(MEM_READ_LATENCY + COND_JUMP_INSTR_TIME + ALU_INSTR_TIME):
-        await RisingEdge(dut.clk)
+    await ClockCycles(dut.clk, MEM_READ_LATENCY + COND_JUMP_INSTR_TIME + ALU_INSTR_TIME)
 
     read_command = dut.dpr.cmd_buf_out.value
 
@@ -394,15 +442,13 @@ async def inc_qclk_i_test(dut):
     cmd_list.append(cg.pulse_i(10, 0, 4, 2, 1, qclk_wait_t))
     cmd_list.append(cg.alu_cmd('inc_qclk', 'i', qclk_inc_val))
 
-    await cocotb.start(generate_clock(dut))
+    cocotb.start_soon(Clock(dut.clk, 2*CLK_CYCLE, units='ns').start())
     await load_commands(dut, cmd_list)
     dut.reset.value = 1
-    await RisingEdge(dut.clk)
-    await RisingEdge(dut.clk)
+    await ClockCycles(dut.clk, 2)
     dut.reset.value = 0
 
-    for i in range(cmd_wait_range + PULSE_INSTR_TIME + ALU_INSTR_TIME + MEM_READ_LATENCY + RESET_LATENCY + 1):
-        await RisingEdge(dut.clk)
+    await ClockCycles(dut.clk, cmd_wait_range + PULSE_INSTR_TIME + ALU_INSTR_TIME + MEM_READ_LATENCY + RESET_LATENCY + 1)
     
     qclk_read_val = dut.dpr.qclk_out.value
     qclk_correct_val = evaluate_alu_exp(qclk_inc_val, 'add', cmd_wait_range + PULSE_INSTR_TIME \
@@ -412,7 +458,7 @@ async def inc_qclk_i_test(dut):
     dut._log.debug('qclk_inc_val: {}'.format(qclk_inc_val))
     dut._log.debug('qclk_correct_val: {}'.format(qclk_correct_val))
 
-    assert int(qclk_read_val) == qclk_correct_val
+    assert qclk_read_val.integer == qclk_correct_val
 
 @cocotb.test()
 async def read_fproc_test(dut):
@@ -426,26 +472,23 @@ async def read_fproc_test(dut):
 
     fproc_ready_t = random.randint(fproc_min_t, fproc_max_t)
 
-    await cocotb.start(generate_clock(dut))
+    cocotb.start_soon(Clock(dut.clk, 2*CLK_CYCLE, units='ns').start())
+    clk_edge = RisingEdge(dut.clk)
     await load_commands(dut, cmd_list)
     dut.reset.value = 1
-    await RisingEdge(dut.clk)
-    await RisingEdge(dut.clk)
+    await ClockCycles(dut.clk, 2)
     dut.reset.value = 0
-    for i in range(MEM_READ_LATENCY + RESET_LATENCY):
-        await RisingEdge(dut.clk)
+    await ClockCycles(dut.clk, MEM_READ_LATENCY + RESET_LATENCY)
 
-    for i in range(fproc_ready_t):
-        await RisingEdge(dut.clk)
+    await ClockCycles(dut.clk, fproc_ready_t)
     
     dut.fproc_ready.value = 1
     dut.fproc_data.value = fproc_rval
 
-    await RisingEdge(dut.clk)
+    await clk_edge
     dut.fproc_ready.value = 0
     dut.fproc_data.value = 0
-    for i in range(COND_JUMP_INSTR_TIME):
-        await RisingEdge(dut.clk)
+    await ClockCycles(dut.clk, COND_JUMP_INSTR_TIME)
     reg_rval_read = dut.dpr.regs.data[read_reg_addr].value
 
     assert reg_rval_read == fproc_rval
@@ -458,36 +501,32 @@ async def jump_fproc_i_test(dut):
 
     fproc_rval = random.randint(-2**31, 2**31-1)
     cmp_ival = random.randint(-2**31, 2**31-1)
-    #regwrite_addr = 3
-    #cmd_list.append(cg.alu_cmd('reg_alu', 'i', cmp_ival, 'id0', 0, regwrite_addr))
     op = random.choice(['le', 'ge', 'eq'])
     cmd_list.append(cg.alu_cmd('jump_fproc', 'i', cmp_ival, op, jump_cmd_ptr=jump_addr))
 
     fproc_ready_t = random.randint(0, fproc_max_t)
 
-    for i in range(1, 2**8):
-        cmd_list.append(random.randint(0,2**32))
+    rng = np.random.default_rng()
+    cmd_list.extend(rng.integers(0, 1 << 32, size=2**8 - 1).tolist())
 
-    await cocotb.start(generate_clock(dut))
+    cocotb.start_soon(Clock(dut.clk, 2*CLK_CYCLE, units='ns').start())
+    clk_edge = RisingEdge(dut.clk)
     await load_commands(dut, cmd_list)
     dut.reset.value = 1
-    await RisingEdge(dut.clk)
-    await RisingEdge(dut.clk)
+    await ClockCycles(dut.clk, 2)
     dut.reset.value = 0
-    for i in range(MEM_READ_LATENCY + ALU_INSTR_TIME):
-        await RisingEdge(dut.clk)
+    await ClockCycles(dut.clk, MEM_READ_LATENCY + ALU_INSTR_TIME)
 
-    for i in range(fproc_ready_t):
-        await RisingEdge(dut.clk)
+    for i in range(fproc_ready_t): #may be 0, ClockCycles always waits at least one edge
+        await clk_edge
     
     dut.fproc_ready.value = 1
     dut.fproc_data.value = fproc_rval
 
-    await RisingEdge(dut.clk)
+    await clk_edge
     dut.fproc_ready.value = 0
     dut.fproc_data.value = 0
-    await RisingEdge(dut.clk)
-    await RisingEdge(dut.clk)
+    await ClockCycles(dut.clk, 2)
 
     read_command = dut.dpr.cmd_buf_out.value
 
@@ -509,18 +548,17 @@ async def done_gate_test(dut):
     cmd_list.append(cg.alu_cmd('reg_alu', 'i', 1, 'id0', write_reg_addr=0))
     cmd_list.append(cg.done_cmd())
 
-    await cocotb.start(generate_clock(dut))
+    cocotb.start_soon(Clock(dut.clk, 2*CLK_CYCLE, units='ns').start())
+    clk_edge = RisingEdge(dut.clk)
     await load_commands(dut, cmd_list)
     dut.reset.value = 1
-    await RisingEdge(dut.clk)
-    await RisingEdge(dut.clk)
+    await ClockCycles(dut.clk, 2)
     dut.reset.value = 0
-    for i in range(MEM_READ_LATENCY + RESET_LATENCY + 3*ALU_INSTR_TIME + 2):
-        await(RisingEdge(dut.clk))
+    await ClockCycles(dut.clk, MEM_READ_LATENCY + RESET_LATENCY + 3*ALU_INSTR_TIME + 2)
 
     donegate = dut.done_gate.value
     assert donegate == 1
-    await(RisingEdge(dut.clk))
+    await clk_edge
     donegate = dut.done_gate.value
     assert donegate == 1
 
@@ -529,18 +567,17 @@ async def pulse_reset_test(dut):
     cmd_list = []
     cmd_list.append(cg.pulse_reset())
 
-    await cocotb.start(generate_clock(dut))
+    cocotb.start_soon(Clock(dut.clk, 2*CLK_CYCLE, units='ns').start())
+    clk_edge = RisingEdge(dut.clk)
     await load_commands(dut, cmd_list)
     dut.reset.value = 1
-    await RisingEdge(dut.clk)
-    await RisingEdge(dut.clk)
+    await ClockCycles(dut.clk, 2)
     dut.reset.value = 0
-    for i in range(MEM_READ_LATENCY + RESET_LATENCY + 1):
-        await(RisingEdge(dut.clk))
+    await ClockCycles(dut.clk, MEM_READ_LATENCY + RESET_LATENCY + 1)
 
     rst = dut.pulse_reset.value
     assert rst == 1
-    await(RisingEdge(dut.clk))
+    await clk_edge
     rst = dut.pulse_reset.value
     assert rst == 0 
 
@@ -565,27 +602,31 @@ async def pulse_sync_test(dut):
         cmd_list.append(cg.pulse_i(freq_word, phase_word, amp_word, env_word, cfg_word, pulse_time_list[i]))
     
     cmd_list.insert(-1, cg.sync(0))
-    await cocotb.start(generate_clock(dut))
+    cocotb.start_soon(Clock(dut.clk, 2*CLK_CYCLE, units='ns').start())
+    clk_edge = RisingEdge(dut.clk)
     await load_commands(dut, cmd_list)
     dut.reset.value = 1
-    await RisingEdge(dut.clk)
-    await RisingEdge(dut.clk)
+    await ClockCycles(dut.clk, 2)
     dut.reset.value = 0
-    await RisingEdge(dut.clk)
-    await RisingEdge(dut.clk)
+    await ClockCycles(dut.clk, 2)
 
     freq_read_list = []
     phase_read_list = []
     env_read_list = []
     pulse_read_times = []
 
+    qclk_out = dut.dpr.qclk_out
+    cstrobe_out = dut.cstrobe_out
+    freq_out = dut.freq
+    phase_out = dut.phase
+    env_word_out = dut.env_word
     for i in range(45):
-        if(dut.cstrobe_out.value == 1):
-            freq_read_list.append(dut.freq.value)
-            phase_read_list.append(dut.phase.value)
-            env_read_list.append(dut.env_word.value)
-            pulse_read_times.append(dut.dpr.qclk_out.value)
-        await RisingEdge(dut.clk)
+        if(cstrobe_out.value == 1):
+            freq_read_list.append(freq_out.value)
+            phase_read_list.append(phase_out.value)
+            env_read_list.append(env_word_out.value)
+            pulse_read_times.append(qclk_out.value)
+        await clk_edge
         if i == 30:
             dut.sync_ready.value = 1
         elif i == 31:
@@ -604,16 +645,18 @@ async def idle_test(dut):
     cmd_list.append(cg.idle(100))
     cmd_list.append(cg.done_cmd())
 
-    await cocotb.start(generate_clock(dut))
+    cocotb.start_soon(Clock(dut.clk, 2*CLK_CYCLE, units='ns').start())
+    clk_edge = RisingEdge(dut.clk)
     await load_commands(dut, cmd_list)
     dut.reset.value = 1
-    await RisingEdge(dut.clk)
-    await RisingEdge(dut.clk)
+    await ClockCycles(dut.clk, 2)
     dut.reset.value = 0
+    qclk_out = dut.dpr.qclk_out
+    done_gate = dut.done_gate
     for i in range(105 + MEM_READ_LATENCY + RESET_LATENCY + 3*ALU_INSTR_TIME + 2):
-        await(RisingEdge(dut.clk))
-        if dut.done_gate.value == 1:
-            done_qclk_time = int(dut.dpr.qclk_out.value)
+        await clk_edge
+        if done_gate.value == 1:
+            done_qclk_time = qclk_out.value.integer
             break
 
     dut._log.debug(f'qclk_done_time: {done_qclk_time}')
@@ -626,14 +669,12 @@ async def idle_pulse_test(dut):
     cmd_list.append(cg.pulse_i(10, 3, 1, 0, 0, 103))
     cmd_list.append(cg.done_cmd())
 
-    await cocotb.start(generate_clock(dut))
+    cocotb.start_soon(Clock(dut.clk, 2*CLK_CYCLE, units='ns').start())
     await load_commands(dut, cmd_list)
     dut.reset.value = 1
-    await RisingEdge(dut.clk)
-    await RisingEdge(dut.clk)
+    await ClockCycles(dut.clk, 2)
     dut.reset.value = 0
-    for i in range(105 + MEM_READ_LATENCY + RESET_LATENCY + 3*ALU_INSTR_TIME + 2 + 100):
-        await(RisingEdge(dut.clk))
+    await ClockCycles(dut.clk, 105 + MEM_READ_LATENCY + RESET_LATENCY + 3*ALU_INSTR_TIME + 2 + 100)
 
 
 def evaluate_alu_exp(in0, op, in1):
@@ -48,16 +48,53 @@
 
 import distproc.command_gen as cg
 import copy
+import functools
 import numpy as np
-#import ipdb
 import distproc.hwconfig as hw
-from collections import OrderedDict
 import warnings
 import json
+import hashlib
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
 
 ENV_BITS = 16
 N_MAX_REGS = 16
 
+# ALU instruction groupings by operand
+ALU_OPS = frozenset(('reg_alu', 'jump_cond', 'alu_fproc', 'jump_fproc', 'inc_qclk'))
+REG_IN1_OPS = frozenset(('reg_alu', 'jump_cond'))
+OUT_REG_OPS = frozenset(('reg_alu', 'alu_fproc'))
+JUMP_OPS = frozenset(('jump_cond', 'jump_fproc'))
+FPROC_OPS = frozenset(('alu_fproc', 'jump_fproc'))
+
+# encoded commands for ops that don't take any arguments
+FIXED_CMD_BYTES = {'pulse_reset': cg.pulse_reset().to_bytes(16, 'little'),
+                   'done_stb': cg.done_cmd().to_bytes(16, 'little')}
+
+
+def _digest(buf):
+    """
+    64-bit content digest of buf (xxh3 if available, else blake2b)
+    """
+    if xxhash is not None:
+        return xxhash.xxh3_64_intdigest(buf)
+    return int.from_bytes(hashlib.blake2b(buf, digest_size=8).digest(), 'little')
+
+def _max_env_component(env):
+    """
+    Largest |real| or |imag| sample value in env. Complex arrays are viewed
+    as interleaved floats so this is a single max/min pass over the buffer
+    with no temporaries.
+    """
+    if env.size == 0:
+        return 0
+    if np.iscomplexobj(env):
+        env = np.ascontiguousarray(env)
+        env = env.view(env.real.dtype)
+    return max(env.max(), -env.min())
+
 
 class SingleCoreAssembler:
     """
@@ -82,51 +119,66 @@ class SingleCoreAssembler:
     """
     def __init__(self, elem_cfgs):
         self.n_element = len(elem_cfgs)
-        self._env_dicts = [OrderedDict() for i in range(self.n_element)] #map names to envelope
+        self._env_dicts = [{} for i in range(self.n_element)] #map names to envelope
+        self._env_content_keys = [{} for i in range(self.n_element)] #map env names to content key (array/dict envs only)
         self._freq_lists = [[] for i in range(self.n_element)] #map inds to freq
         self._program = []
         self._regs = {}
+        self._next_reg_ind = 0
         self._elem_cfgs = elem_cfgs
+        self._env_hash_memo = None
+        self._compiled_program = None # cached get_compiled_program output; cleared by anything that modifies the program
+        self._env_freq_buffers = None # cached env/freq buffers + index maps; cleared when envs or freqs are added
+
+        # program list op -> method used by from_list (pulse and jump_label are handled separately)
+        self._list_op_methods = {'reg_write': self.add_reg_write,
+                                 'phase_reset': self.add_phase_reset,
+                                 'done_stb': self.add_done_stb,
+                                 'declare_freq': self.add_freq,
+                                 'declare_reg': self.declare_reg,
+                                 'inc_qclk': self.add_inc_qclk,
+                                 'idle': self.add_idle,
+                                 'jump_i': self.add_jump_i,
+                                 'reg_alu': functools.partial(self.add_alu_cmd, 'reg_alu'),
+                                 'jump_cond': functools.partial(self.add_alu_cmd, 'jump_cond'),
+                                 'alu_fproc': functools.partial(self.add_alu_cmd, 'alu_fproc'),
+                                 'jump_fproc': functools.partial(self.add_alu_cmd, 'jump_fproc')}
 
     def from_list(self, cmd_list):
+        # envelope arrays referenced by cmd_list can't change while it's being
+        # added, so each array object only needs to be hashed once
+        self._env_hash_memo = {}
+        try:
+            self._add_cmd_list(cmd_list)
+        finally:
+            self._env_hash_memo = None
+
+    def _add_cmd_list(self, cmd_list):
         for i, cmd in enumerate(cmd_list):
+            op = cmd['op']
             cmdargs = cmd.copy()
             del cmdargs['op']
-            if cmd['op'] == 'pulse':
+            if op == 'pulse':
                 nreg_params = np.sum([isinstance(cmd[key], str) for key in ['freq', 'amp', 'phase']])
                 if nreg_params > 1:
                     warnings.warn('{} will be split into multiple instructions, which may cause timing problems'.format(cmd))
                 self.add_pulse(**cmdargs)
-            elif cmd['op'] in ['reg_alu', 'jump_cond', 'alu_fproc', 'jump_fproc']:
-                self.add_alu_cmd(**cmd)
-            elif cmd['op'] == 'reg_write':
-                self.add_reg_write(**cmdargs)
-            elif cmd['op'] == 'phase_reset':
-                self.add_phase_reset(**cmdargs)
-            elif cmd['op'] == 'done_stb':
-                self.add_done_stb(**cmdargs)
-            elif cmd['op'] == 'declare_freq':
-                self.add_freq(**cmdargs)
-            elif cmd['op'] == 'declare_reg':
-                self.declare_reg(**cmdargs)
-            elif cmd['op'] == 'inc_qclk':
-                self.add_inc_qclk(**cmdargs)
-            elif cmd['op'] == 'idle':
-                self.add_idle(**cmdargs)
-            elif cmd['op'] == 'jump_label':
+            elif op == 'jump_label':
                 cmd_list[i + 1]['label'] = cmdargs['dest_label']
-            elif cmd['op'] == 'jump_i':
-                self.add_jump_i(**cmdargs)
+            elif op in self._list_op_methods:
+                self._list_op_methods[op](**cmdargs)
             else:
                 raise Exception('{} not supported!'.format(cmd))
 
     def add_jump_i(self, jump_label, label=None):
+        self._compiled_program = None
         cmd = {'op': 'jump_i', 'jump_label': jump_label}
         if label is not None:
             cmd['label'] = label
         self._program.append(cmd)
 
     def add_idle(self, end_time, label=None):
+        self._compiled_program = None
         cmd = {'op': 'idle', 'end_time': end_time}
         if label is not None:
             cmd['label'] = label
@@ -134,7 +186,8 @@ class SingleCoreAssembler:
 
     def add_alu_cmd(self, op: str, in0: int | str, alu_op: str, in1_reg: str = None, 
                     out_reg: str = None, jump_label: str = None, func_id: int | tuple | str = None, label: str = None):
-        assert op in ['reg_alu', 'jump_cond', 'alu_fproc', 'jump_fproc', 'inc_qclk']
+        self._compiled_program = None
+        assert op in ALU_OPS
         if in1_reg is not None:
             assert in1_reg in self._regs.keys()
         if isinstance(in0, str):
@@ -142,7 +195,7 @@ class SingleCoreAssembler:
 
         cmd = {'op' : op, 'in0' : in0, 'alu_op' : alu_op}
 
-        if op in ['reg_alu', 'jump_cond']:
+        if op in REG_IN1_OPS:
             assert in1_reg is not None
             assert func_id is None
             if isinstance(in0, str):
@@ -151,7 +204,7 @@ class SingleCoreAssembler:
         else:
             assert in1_reg is None
 
-        if op in ['reg_alu', 'alu_fproc']:
+        if op in OUT_REG_OPS:
             assert out_reg is not None
             if isinstance(in0, str):
                 assert self._regs[in0]['dtype'] == self._regs[out_reg]['dtype']
@@ -161,11 +214,11 @@ class SingleCoreAssembler:
         else:
             assert out_reg is None
 
-        if op in ['jump_cond', 'jump_fproc']:
+        if op in JUMP_OPS:
             assert jump_label is not None
             cmd['jump_label'] = jump_label
 
-        if op in ['alu_fproc', 'jump_fproc']:  # None defaults to 0, implies func_id not used
+        if op in FPROC_OPS:  # None defaults to 0, implies func_id not used
             cmd['func_id'] = func_id
         else:
             assert func_id is None
@@ -176,36 +229,44 @@ class SingleCoreAssembler:
         self._program.append(cmd)
 
     def add_env(self, name, env, elem_ind):
-        if np.any(np.abs(env) > 1):
+        self._compiled_program = None
+        self._env_freq_buffers = None
+        if np.max(np.abs(env), initial=0) > 1:
             raise Exception('env mag must be < 1')
+        env = self._copy_env(env)
         self._env_dicts[elem_ind][name] = env
+        content_key = self._get_env_content_key(env)
+        if content_key is not None:
+            self._env_content_keys[elem_ind][name] = content_key
+        else:
+            self._env_content_keys[elem_ind].pop(name, None)
 
     def add_freq(self, freq, elem_ind, freq_ind=None):
+        self._compiled_program = None
+        self._env_freq_buffers = None
+        freq_list = self._freq_lists[elem_ind]
         if freq_ind is None:
-            self._freq_lists[elem_ind].append(freq)
-        elif freq_ind >= len(self._freq_lists[elem_ind]):
-            for i in range(len(self._freq_lists[elem_ind]) - freq_ind):
-                self._freq_lists[elem_ind].append(None)
-            self._freq_lists[elem_ind].append(freq)
+            freq_list.append(freq)
+        elif freq_ind >= len(freq_list):
+            freq_list.extend([None] * (freq_ind - len(freq_list)))
+            freq_list.append(freq)
         else:
-            if self._freq_lists[elem_ind][freq_ind] is None:
+            if freq_list[freq_ind] is not None:
                 raise ValueError('ind {} is already occupied!'.format(freq_ind))
-            self._freq_lists[elem_ind][freq_ind] = freq
+            freq_list[freq_ind] = freq
 
     def declare_reg(self, name, dtype=('int',)):
         """
         Declare a named register that can be referenced
         by subsequent commands
         """
-        if not self._regs:
-            self._regs[name] = {'index': 0, 'dtype': dtype}
-        elif 'name' in self._regs.keys():
+        self._compiled_program = None
+        if name in self._regs:
             raise Exception('Register already declared!') #maybe make this a warning?
-        else:
-            max_regind = max([reg['index'] for reg in self._regs.values()])
-            if max_regind >= N_MAX_REGS - 1:
-                raise Exception('cannot add any more regs, limit of {} reached'.format(N_MAX_REGS))
-            self._regs[name] = {'index': max_regind + 1, 'dtype': dtype}
+        if self._next_reg_ind >= N_MAX_REGS:
+            raise Exception('cannot add any more regs, limit of {} reached'.format(N_MAX_REGS))
+        self._regs[name] = {'index': self._next_reg_ind, 'dtype': dtype}
+        self._next_reg_ind += 1
 
     def add_reg_write(self, name, value, dtype=None, label=None):
         """
@@ -238,12 +299,14 @@ class SingleCoreAssembler:
         self.add_alu_cmd('reg_alu', in0, alu_op, in1_reg, out_reg, label=label)
 
     def add_phase_reset(self, label=None):
+        self._compiled_program = None
         cmd = {'op': 'pulse_reset'}
         if label is not None:
             cmd['label'] = label
         self._program.append(cmd)
 
     def add_done_stb(self, label=None):
+        self._compiled_program = None
         cmd = {'op': 'done_stb'}
         if label is not None:
             cmd['label'] = label
@@ -281,21 +344,28 @@ class SingleCoreAssembler:
             label : str
                 label for this program instruction. Useful (required) for jumps.
         """
+        self._compiled_program = None
+        env_dict = self._env_dicts[elem_ind]
         if isinstance(env, np.ndarray): 
-            if np.any((np.abs(np.real(env)) > 1) | (np.abs(np.imag(env)) > 1)):
+            if _max_env_component(env) > 1:
                 raise Exception('env must be < 1')
             envkey = self._hash_env(env)
-            if envkey not in self._env_dicts[elem_ind]:
-                self._env_dicts[elem_ind][envkey] = env
+            if envkey not in env_dict:
+                self._env_freq_buffers = None
+                env_dict[envkey] = self._copy_env(env)
+                self._env_content_keys[elem_ind][envkey] = envkey
         elif isinstance(env, dict):
             envkey = self._hash_env(env)
-            if envkey not in self._env_dicts[elem_ind]:
-                self._env_dicts[elem_ind][envkey] = env
+            if envkey not in env_dict:
+                self._env_freq_buffers = None
+                env_dict[envkey] = self._copy_env(env)
+                self._env_content_keys[elem_ind][envkey] = envkey
         elif isinstance(env, str):
             envkey = env
-            if envkey not in self._env_dicts[elem_ind]:
+            if envkey not in env_dict:
                 if envkey == 'cw':
-                    self._env_dicts[elem_ind][envkey] = 'cw'
+                    self._env_freq_buffers = None
+                    env_dict[envkey] = 'cw'
                 else:
                     raise Exception(f'Envelope not found: {envkey}')
         else:
@@ -327,7 +397,7 @@ class SingleCoreAssembler:
             cmd = {'op': 'pulse', 'phase': phase, 'amp': amp, 'start_time': start_time,
                    'env': envkey, 'elem': elem_ind}
         elif isinstance(phase, str) and isinstance(amp, str):
-            self._program.append({'op': 'pulse', 'freq': phase})
+            self._program.append({'op': 'pulse', 'phase': phase, 'elem': elem_ind})
             cmd = {'op': 'pulse', 'freq': freq, 'amp': amp, 'start_time': start_time,
                    'env': envkey, 'elem': elem_ind}
         else:
@@ -341,120 +411,140 @@ class SingleCoreAssembler:
     def get_compiled_program(self):
         # consider splitting this into a few different functions
         # at top case level
-        cmd_buf = bytes()
-        freq_list = []
-        env_raw, env_word_map = self._get_env_buffers()
-        cmd_label_addrmap = self._get_cmd_labelmap()
-        freq_raw, freq_ind_map = self._get_freq_buffers()
-        for cmd in self._program:
-            cmd = copy.deepcopy(cmd)  # we are modifying cmd so don't overwrite anything in self._program
+        if self._compiled_program is not None:
+            cmd_buf, env_raw, freq_raw = self._compiled_program
+            return cmd_buf, list(env_raw), list(freq_raw)
+
+        cmd_buf = bytearray()
+        if self._env_freq_buffers is None:
+            self._env_freq_buffers = (self._get_env_buffers(), self._get_freq_buffers())
+        (env_raw, env_word_map), (freq_raw, freq_ind_map) = self._env_freq_buffers
+
+        # elem cfg word conversions only depend on (elem, value), and programs
+        # tend to reuse a handful of freqs/phases/amps, so convert each once
+        word_cache = {}
+        def elem_word(getter, elem, *args):
+            key = (getter, elem) + args
+            if key not in word_cache:
+                word_cache[key] = getattr(self._elem_cfgs[elem], getter)(*args)
+            return word_cache[key]
+
+        reg_inds = {name: reg['index'] for name, reg in self._regs.items()}
+
+        # labels are collected as we go; jumps to labels that haven't been
+        # seen yet are emitted as placeholders and patched after the loop
+        cmd_label_addrmap = {}
+        jump_fixups = []
+        def add_jump(jump_label, make_cmd):
+            if jump_label in cmd_label_addrmap:
+                cmd_buf.extend(make_cmd(cmd_label_addrmap[jump_label]).to_bytes(16, 'little'))
+            else:
+                jump_fixups.append((len(cmd_buf), jump_label, make_cmd))
+                cmd_buf.extend(bytes(16))
+
+        for i, cmd in enumerate(self._program):
+            label = cmd.get('label')
+            if label is not None:
+                if label in cmd_label_addrmap:
+                    raise Exception('label already in use!')
+                cmd_label_addrmap[label] = i
 
-            if cmd['op'] == 'pulse':
-                pulseargs = {}
+            op = cmd['op']
+            if op == 'pulse':
+                elem = cmd.get('elem')
+                freq_word = freq_regaddr = phase_word = phase_regaddr = None
+                amp_word = amp_regaddr = env_word = cmd_time = cfg_word = None
 
-                if 'freq' in cmd.keys():
+                if 'freq' in cmd:
                     if isinstance(cmd['freq'], str):
-                        pulseargs['freq_regaddr'] = self._regs[cmd['freq']]['index']
+                        freq_regaddr = reg_inds[cmd['freq']]
                     else:
-                        pulseargs['freq_word'] = self._elem_cfgs[cmd['elem']].get_freq_addr(freq_ind_map[cmd['elem']][cmd['freq']])
+                        freq_word = elem_word('get_freq_addr', elem, freq_ind_map[elem][cmd['freq']])
 
-                if 'phase' in cmd.keys():
+                if 'phase' in cmd:
                     if isinstance(cmd['phase'], str):
-                        pulseargs['phase_regaddr'] = self._regs[cmd['phase']]['index']
+                        phase_regaddr = reg_inds[cmd['phase']]
                     else:
-                        pulseargs['phase_word'] = self._elem_cfgs[cmd['elem']].get_phase_word(cmd['phase'])
+                        phase_word = elem_word('get_phase_word', elem, cmd['phase'])
 
-                if 'amp' in cmd.keys():
+                if 'amp' in cmd:
                     if isinstance(cmd['amp'], str):
-                        pulseargs['amp_regaddr'] = self._regs[cmd['amp']]['index']
+                        amp_regaddr = reg_inds[cmd['amp']]
                     else:
-                        pulseargs['amp_word'] = self._elem_cfgs[cmd['elem']].get_amp_word(cmd['amp'])
+                        amp_word = elem_word('get_amp_word', elem, cmd['amp'])
 
-                if 'env' in cmd.keys():
-                    pulseargs['env_word'] = env_word_map[cmd['elem']][cmd['env']] 
+                if 'env' in cmd:
+                    env_word = env_word_map[elem][cmd['env']] 
 
-                if 'start_time' in cmd.keys():
-                    pulseargs['cmd_time'] = cmd['start_time']
+                if 'start_time' in cmd:
+                    cmd_time = cmd['start_time']
 
-                if 'elem' in cmd.keys():
-                    pulseargs['cfg_word'] = self._elem_cfgs[cmd['elem']].get_cfg_word(cmd['elem'], None)
+                if elem is not None:
+                    cfg_word = elem_word('get_cfg_word', elem, elem, None)
                     
-                cmd_buf += cg.pulse_cmd(**pulseargs).to_bytes(16, 'little')
+                cmd_buf += cg.pulse_cmd(freq_word, freq_regaddr, phase_word, phase_regaddr, amp_word, 
+                                        amp_regaddr, cfg_word, env_word, None, cmd_time).to_bytes(16, 'little')
 
-            elif cmd['op'] in ['reg_alu', 'jump_cond', 'alu_fproc', 'jump_fproc', 'inc_qclk']:
+            elif op in ALU_OPS:
                 if isinstance(cmd['in0'], str):
-                    in0 = self._regs[cmd['in0']]['index']
+                    in0 = reg_inds[cmd['in0']]
                     im_or_reg = 'r'
                 else:
                     in0 = cmd['in0']
                     im_or_reg = 'i'
 
                     # if we're writing to/interacting with typed register, typecast intermediate value accordingly
-                    if 'out_reg' in cmd.keys() or 'in1_reg' in cmd.keys():
-                        dtype = self._regs[cmd['out_reg']]['dtype'] if 'out_reg' in cmd.keys() else self._regs[cmd['in1_reg']]['dtype']
+                    if 'out_reg' in cmd or 'in1_reg' in cmd:
+                        dtype = self._regs[cmd['out_reg']]['dtype'] if 'out_reg' in cmd else self._regs[cmd['in1_reg']]['dtype']
                         if dtype[0] == 'phase':
-                            in0 = self._elem_cfgs[dtype[1]].get_phase_word(cmd['in0'])
+                            in0 = elem_word('get_phase_word', dtype[1], cmd['in0'])
                         elif dtype[0] == 'amp':
-                            in0 = self._elem_cfgs[dtype[1]].get_amp_word(cmd['in0'])
+                            in0 = elem_word('get_amp_word', dtype[1], cmd['in0'])
 
-                if 'out_reg' in cmd.keys():
-                    cmd['out_reg'] = self._regs[cmd['out_reg']]['index']
+                out_reg = reg_inds[cmd['out_reg']] if 'out_reg' in cmd else None
+                in1_reg = reg_inds[cmd['in1_reg']] if 'in1_reg' in cmd else None
 
-                if 'jump_label' in cmd.keys():
-                    cmd['jump_addr'] = cmd_label_addrmap[cmd['jump_label']]
-
-                if 'in1_reg' in cmd.keys():
-                    cmd['in1_reg'] = self._regs[cmd['in1_reg']]['index']
-
-                cmd_raw = cg.alu_cmd(cmd['op'], im_or_reg, in0, cmd.get('alu_op'),
-                        cmd.get('in1_reg'), cmd.get('out_reg'), cmd.get('jump_addr'), cmd.get('func_id'))
-                cmd_buf += cmd_raw.to_bytes(16, 'little')
+                if 'jump_label' in cmd:
+                    add_jump(cmd['jump_label'], functools.partial(cg.alu_cmd, op, im_or_reg, in0, cmd.get('alu_op'),
+                            in1_reg, out_reg, func_id=cmd.get('func_id')))
+                else:
+                    cmd_raw = cg.alu_cmd(op, im_or_reg, in0, cmd.get('alu_op'),
+                            in1_reg, out_reg, None, cmd.get('func_id'))
+                    cmd_buf += cmd_raw.to_bytes(16, 'little')
 
-            elif cmd['op'] == 'jump_i':
-                cmd['jump_addr'] = cmd_label_addrmap[cmd['jump_label']]
-                cmd_buf += cg.jump_i(cmd['jump_addr']).to_bytes(16, 'little')
+            elif op in FIXED_CMD_BYTES:
+                cmd_buf += FIXED_CMD_BYTES[op]
 
-            elif cmd['op'] == 'pulse_reset':
-                cmd_buf += cg.pulse_reset().to_bytes(16, 'little')
+            elif op == 'jump_i':
+                add_jump(cmd['jump_label'], cg.jump_i)
 
-            elif cmd['op'] == 'idle':
+            elif op == 'idle':
                 cmd_buf += cg.idle(cmd['end_time']).to_bytes(16, 'little')
 
-            elif cmd['op'] == 'done_stb':
-                cmd_buf += cg.done_cmd().to_bytes(16, 'little')
-
             else:
-                raise Exception('{} not supported'.format(cmd['op']))
+                raise Exception('{} not supported'.format(op))
+
+        for buf_ind, jump_label, make_cmd in jump_fixups:
+            cmd_buf[buf_ind:buf_ind + 16] = make_cmd(cmd_label_addrmap[jump_label]).to_bytes(16, 'little')
 
-        return cmd_buf, env_raw, freq_raw
+        cmd_bytes = bytes(cmd_buf)
+        self._compiled_program = (cmd_bytes, env_raw, freq_raw)
+        return cmd_bytes, list(env_raw), list(freq_raw)
 
     def get_sim_program(self):
         """
         Get a pulse/command list usable by simulation tools. Currently, this is the same as
-        self._program, but with env names replaced by data
+        self._program, but with env names replaced by data.
         """
         cmd_list = []
         for cmd in self._program:
-            cmd = copy.deepcopy(cmd)
-            if cmd['op'] == 'pulse':
-                cmd.update({'env': self._env_dicts[cmd['elem']][cmd['env']]})
+            cmd = dict(cmd) # callers may edit these; keep them from touching self._program
+            if cmd['op'] == 'pulse' and 'env' in cmd:
+                cmd['env'] = self._env_dicts[cmd['elem']][cmd['env']]
             cmd_list.append(cmd)
 
         return cmd_list
 
-    def _get_cmd_labelmap(self):
-        """
-        Get command locations (addresses) for labeled commands.
-        Used for jump instructions
-        """
-        labelmap = {}
-        for i, cmd in enumerate(self._program):
-            if 'label' in cmd.keys():
-                if cmd['label'] in labelmap.keys():
-                    raise Exception('label already in use!')
-                labelmap[cmd['label']] = i
-        return labelmap
-
     def _get_env_buffer(self, elem_ind):
         """
         Computes the raw envelope buffer along with a dictionary of indices. Address
@@ -463,7 +553,7 @@ class SingleCoreAssembler:
         Returns
         -------
             env_raw : np.ndarray
-                numpy array of the raw envelope buffer. Each element is a 
+                numpy uint32 array of the raw envelope buffer. Each element is a 
                 32-bit word, with a signed 16-bit I value LSB followed by
                 a signed 16-bit Q value MSB
             env_addr_map : dict
@@ -477,17 +567,33 @@ class SingleCoreAssembler:
         """
         cur_env_ind = 0
         env_word_map = {}
-
-        env_raw = np.empty(0).astype(int)
+        env_chunks = []
+        content_word_map = {} # envelope content hash -> env word, so that identical envelopes share buffer space
+        content_keys = self._env_content_keys[elem_ind]
 
         for envkey, env in self._env_dicts[elem_ind].items():
+            content_key = content_keys.get(envkey)
+            if content_key is not None:
+                if content_key in content_word_map:
+                    env_word_map[envkey] = content_word_map[content_key]
+                    continue
+
             env = self._elem_cfgs[elem_ind].get_env_buffer(env)
             if envkey == 'cw':
                 env_word_map[envkey] = self._elem_cfgs[elem_ind].get_cw_env_word(cur_env_ind)
             else:
                 env_word_map[envkey] = self._elem_cfgs[elem_ind].get_env_word(cur_env_ind, len(env))
+            if content_key is not None:
+                content_word_map[content_key] = env_word_map[envkey]
+            cur_env_ind += len(env)
+            env_chunks.append(np.ravel(env))
+
+        # write each chunk into one presized word buffer (signed words wrap to uint32)
+        env_raw = np.empty(cur_env_ind, dtype=np.uint32)
+        cur_env_ind = 0
+        for env in env_chunks:
+            env_raw[cur_env_ind:cur_env_ind + len(env)] = env
             cur_env_ind += len(env)
-            env_raw = np.append(env_raw, env)
 
         return env_raw, env_word_map
     
@@ -501,7 +607,6 @@ class SingleCoreAssembler:
         for i in range(self.n_element):
             d, m = self._get_env_buffer(i)
             # todo: figure out if dtype should be enforced in hwconfig
-            d = np.array(d, dtype=np.uint32)
             env_data.append(d.tobytes())
             env_word_maps.append(m)
 
@@ -512,7 +617,9 @@ class SingleCoreAssembler:
         Return the full raw freq buffer + index map
         """
         freq_buffer = self._elem_cfgs[elem_ind].get_freq_buffer(self._freq_lists[elem_ind])
-        freq_ind_map = {f: self._freq_lists[elem_ind].index(f) for f in self._freq_lists[elem_ind]}
+        freq_ind_map = {}
+        for i, f in enumerate(self._freq_lists[elem_ind]):
+            freq_ind_map.setdefault(f, i) # keep first index if duplicated
         return freq_buffer, freq_ind_map
 
     def _get_freq_buffers(self):
@@ -530,11 +637,43 @@ class SingleCoreAssembler:
 
         return freq_data, freq_ind_maps
 
+    def _copy_env(self, env):
+        """
+        Private copy of an array/dict envelope, so that edits to the caller's
+        object can't go stale in the cached env buffers. Arrays are made read-only.
+        """
+        if isinstance(env, np.ndarray):
+            env = np.array(env, copy=True)
+            env.setflags(write=False)
+        elif isinstance(env, dict):
+            env = copy.deepcopy(env)
+        return env
+
+    def _get_env_content_key(self, env):
+        """
+        Key used to share buffer space between identical envelopes; computed
+        once when the envelope is added. Returns None for non array/dict envs.
+        """
+        if isinstance(env, np.ndarray) or isinstance(env, dict):
+            return self._hash_env(env)
+        return None
+
     def _hash_env(self, env):
+        """
+        Content key for an envelope: (dtype, shape, digest) for arrays, digest of the 
+        sorted json for dicts. Digests are stable across processes.
+        """
         if isinstance(env, np.ndarray):
-            return str(hash(env.data.tobytes()))
+            memo = self._env_hash_memo
+            if memo is not None and id(env) in memo:
+                return memo[id(env)]
+            # hash the array buffer in place (no tobytes() copy)
+            envhash = (env.dtype.str, env.shape, _digest(np.ascontiguousarray(env)))
+            if memo is not None:
+                memo[id(env)] = envhash
+            return envhash
         elif isinstance(env, dict):
-            return str(hash(json.dumps(env, sort_keys=True)))
+            return _digest(json.dumps(env, sort_keys=True).encode())
         else:
             raise Exception('{} not supported!'.format(type(env)))
 
@@ -1,5 +1,4 @@
 import numpy as np
-#import ipdb
 #from instr_params.vh
 #TODO: consider refactoring this into fewer functions,
 #      since many ALU instructions have the same structure
@@ -31,6 +30,11 @@ opcodes = {'pulse_write' : 0b10000,
            'pulse_reset' : 0b10110,
            'idle' : 0b11000}
 
+#full opcode field (opcode + alu_op), pre-shifted into the top byte of the
+#command. Indexed by (opcode name, alu_op)
+opcode_prefixes = {(opname, alu_op) : ((opcodes[opname] << 3) + alu_opcodes[alu_op]) << 120
+                   for opname in opcodes for alu_op in alu_opcodes}
+
 #pulse parameters
 pulse_field_widths = {
         'cmd_time' : 32,
@@ -109,52 +113,52 @@ def pulse_cmd(freq_word=None, freq_regaddr=None, phase_word=None, phase_regaddr=
     cmd = 0
     if cfg_word is not None:
         assert 0 <= cfg_word < 2**pulse_field_widths['cfg']
-        cmd += (int(cfg_word) + 2**4) << pulse_field_pos['cfg']
+        cmd |= (int(cfg_word) + 2**4) << pulse_field_pos['cfg']
     if amp_word is not None:
         assert amp_regaddr is None
         assert 0 <= amp_word < 2**pulse_field_widths['amp']
-        cmd += (int(amp_word) + 2**17) << pulse_field_pos['amp']
+        cmd |= (int(amp_word) + 2**17) << pulse_field_pos['amp']
     if freq_word is not None:
         assert freq_regaddr is None
         assert 0 <= freq_word < 2**pulse_field_widths['freq']
-        cmd += (int(freq_word) + 2**10) << pulse_field_pos['freq']
+        cmd |= (int(freq_word) + 2**10) << pulse_field_pos['freq']
     if phase_word is not None:
         assert phase_regaddr is None
         assert 0 <= phase_word < 2**pulse_field_widths['phase']
-        cmd += (int(phase_word) + 2**18) << pulse_field_pos['phase']
+        cmd |= (int(phase_word) + 2**18) << pulse_field_pos['phase']
     if env_word is not None:
         assert env_regaddr is None
         assert 0 <= env_word < 2**pulse_field_widths['env_word']
-        cmd += (int(env_word) + 2**25) << pulse_field_pos['env_word']
+        cmd |= (int(env_word) + 2**25) << pulse_field_pos['env_word']
     if freq_regaddr is not None:
         assert phase_regaddr is None and env_regaddr is None and amp_regaddr is None
         assert 0 <= freq_regaddr < 16
-        cmd += int(freq_regaddr) << 116
-        cmd += 0b11 << pulse_field_pos['freq'] + pulse_field_widths['freq'] #(37 + 5 + 18 + 9) #enable write + reg_mux
+        cmd |= int(freq_regaddr) << 116
+        cmd |= 0b11 << pulse_field_pos['freq'] + pulse_field_widths['freq'] #(37 + 5 + 18 + 9) #enable write + reg_mux
     if phase_regaddr is not None:
         assert freq_regaddr is None and env_regaddr is None and amp_regaddr is None
         assert 0 <= phase_regaddr < 16
-        cmd += int(phase_regaddr) << 116
-        cmd += 0b11 << pulse_field_pos['phase'] + pulse_field_widths['phase'] #(37 + 5 + 18 + 9) #enable write + reg_mux
+        cmd |= int(phase_regaddr) << 116
+        cmd |= 0b11 << pulse_field_pos['phase'] + pulse_field_widths['phase'] #(37 + 5 + 18 + 9) #enable write + reg_mux
     if amp_regaddr is not None:
         assert freq_regaddr is None and env_regaddr is None and phase_regaddr is None
         assert 0 <= amp_regaddr < 16
-        cmd += int(amp_regaddr) << 116
-        cmd += 0b11 << pulse_field_pos['amp'] + pulse_field_widths['amp'] #(37 + 5 + 18 + 9) #enable write + reg_mux
+        cmd |= int(amp_regaddr) << 116
+        cmd |= 0b11 << pulse_field_pos['amp'] + pulse_field_widths['amp'] #(37 + 5 + 18 + 9) #enable write + reg_mux
     if env_regaddr is not None:
         assert freq_regaddr is None and phase_regaddr is None and amp_regaddr is None
         assert 0 <= env_regaddr < 16
-        cmd += int(env_regaddr) << 116
-        cmd += 0b11 << pulse_field_pos['env_word'] + pulse_field_widths['env_word'] #(37 + 5 + 18 + 9) #enable write + reg_mux
+        cmd |= int(env_regaddr) << 116
+        cmd |= 0b11 << pulse_field_pos['env_word'] + pulse_field_widths['env_word'] #(37 + 5 + 18 + 9) #enable write + reg_mux
 
     if cmd_time is not None:
-        cmd += int(cmd_time) << pulse_field_pos['cmd_time']
+        cmd |= int(cmd_time) << pulse_field_pos['cmd_time']
         assert 0 <= cmd_time < 2**pulse_field_widths['cmd_time']
         opcode = opcodes['pulse_write_trig']
     else:
         opcode = opcodes['pulse_write']
 
-    cmd += (opcode << 123)
+    cmd |= (opcode << 123)
     return cmd
 
 
@@ -176,9 +180,7 @@ def reg_alu_i(value, alu_op, reg_addr, reg_write_addr):
         cmd : int
             128 bit command
     """
-    opcode = (opcodes['reg_alu_i'] << 3) + alu_opcodes[alu_op]
-    #print('reg_fn_opcode:', bin(opcode))
-    return (opcode << 120) + (twos_complement(value) << 88) + (reg_addr << 84) + (reg_write_addr << 80)
+    return opcode_prefixes[('reg_alu_i', alu_op)] | (twos_complement(value) << 88) | (reg_addr << 84) | (reg_write_addr << 80)
 
 def reg_alu(reg_addr0, alu_op, reg_addr1, reg_write_addr):
     """
@@ -198,12 +200,10 @@ def reg_alu(reg_addr0, alu_op, reg_addr1, reg_write_addr):
         cmd : int
             128 bit command
     """
-    opcode = (opcodes['reg_alu_i'] << 3) + alu_opcodes[alu_op]
-    return (opcode << 120) + (reg_addr0 << 116) + (reg_addr1 << 84) + (reg_write_addr << 80)
+    return opcode_prefixes[('reg_alu', alu_op)] | (reg_addr0 << 116) | (reg_addr1 << 84) | (reg_write_addr << 80)
 
 def jump_i(instr_ptr_addr):
-    opcode = opcodes['jump_i'] << 3
-    return (opcode << 120) + (instr_ptr_addr << 68)
+    return opcode_prefixes[('jump_i', 'id0')] | (instr_ptr_addr << 68)
 
 def jump_cond_i(value, alu_op, reg_addr, instr_ptr_addr):
     """
@@ -226,8 +226,7 @@ def jump_cond_i(value, alu_op, reg_addr, instr_ptr_addr):
             128 bit command
     """
     assert alu_op == 'eq' or alu_op == 'le' or alu_op == 'ge'
-    opcode = (opcodes['jump_cond_i'] << 3) + alu_opcodes[alu_op]
-    return (opcode << 120) + (twos_complement(value) << 88) + (reg_addr << 84) + (instr_ptr_addr << 68)
+    return opcode_prefixes[('jump_cond_i', alu_op)] | (twos_complement(value) << 88) | (reg_addr << 84) | (instr_ptr_addr << 68)
 
 def jump_cond(reg_addr0, alu_op, reg_addr1, instr_ptr_addr):
     """
@@ -250,20 +249,55 @@ def jump_cond(reg_addr0, alu_op, reg_addr1, instr_ptr_addr):
             128 bit command
     """
     assert alu_op == 'eq' or alu_op == 'le' or alu_op == 'ge'
-    opcode = (opcodes['jump_cond_i'] << 3) + alu_opcodes[alu_op]
-    return (opcode << 120) + (reg_addr0 << 116) + (reg_addr1 << 84) + (instr_ptr_addr << 68)
+    return opcode_prefixes[('jump_cond', alu_op)] | (reg_addr0 << 116) | (reg_addr1 << 84) | (instr_ptr_addr << 68)
+
+def make_reg_alu_i(alu_op):
+    """
+    Returns a version of reg_alu_i specialized to a fixed alu_op,
+    with the opcode prefix resolved up front. Useful when emitting
+    many commands with the same operation.
+
+    Parameters
+    ----------
+        alu_op : str
+            one of: 'id', 'add', 'sub', 'eq', 'le', 'ge'
+
+    Returns
+    -------
+        function (value, reg_addr, reg_write_addr) -> 128 bit command
+    """
+    prefix = opcode_prefixes[('reg_alu_i', alu_op)]
+    def reg_alu_i_op(value, reg_addr, reg_write_addr):
+        return prefix | (twos_complement(value) << 88) | (reg_addr << 84) | (reg_write_addr << 80)
+    return reg_alu_i_op
+
+def make_jump_cond_i(alu_op):
+    """
+    Returns a version of jump_cond_i specialized to a fixed alu_op.
+
+    Parameters
+    ----------
+        alu_op : str
+            one of: 'eq', 'le', 'ge'
+
+    Returns
+    -------
+        function (value, reg_addr, instr_ptr_addr) -> 128 bit command
+    """
+    assert alu_op == 'eq' or alu_op == 'le' or alu_op == 'ge'
+    prefix = opcode_prefixes[('jump_cond_i', alu_op)]
+    def jump_cond_i_op(value, reg_addr, instr_ptr_addr):
+        return prefix | (twos_complement(value) << 88) | (reg_addr << 84) | (instr_ptr_addr << 68)
+    return jump_cond_i_op
 
 def inc_qclk_i(inc_val):
-    opcode = (opcodes['inc_qclk_i'] << 3) + alu_opcodes['add']
-    return (opcode << 120) + (twos_complement(inc_val) << 88)
+    return opcode_prefixes[('inc_qclk_i', 'add')] | (twos_complement(inc_val) << 88)
 
 def inc_qclk(inc_reg_addr):
-    opcode = (opcodes['inc_qclk'] << 3) + alu_opcodes['add']
-    return (opcode << 120) + (inc_reg_addr << 116)
+    return opcode_prefixes[('inc_qclk', 'add')] | (inc_reg_addr << 116)
 
 def alu_fproc(func_id, alu_reg_addr, alu_op, write_reg_addr):
-    opcode = (opcodes['alu_fproc'] << 3) + alu_opcodes[alu_op]
-    return (opcode << 120) + (alu_reg_addr << 116) + (write_reg_addr << 80) + (func_id << 52)
+    return opcode_prefixes[('alu_fproc', alu_op)] | (alu_reg_addr << 116) | (write_reg_addr << 80) | (func_id << 52)
 
 def read_fproc(func_id, write_reg_addr):
     """
@@ -272,12 +306,10 @@ def read_fproc(func_id, write_reg_addr):
     return alu_fproc(func_id, 0, 'id1', write_reg_addr)
 
 def jump_fproc(func_id, alu_reg_addr, alu_op, instr_ptr_addr):
-    opcode = (opcodes['jump_fproc'] << 3) + alu_opcodes[alu_op]
-    return (opcode << 120) + (alu_reg_addr << 116) + (instr_ptr_addr << 76) + (func_id << 52)
+    return opcode_prefixes[('jump_fproc', alu_op)] | (alu_reg_addr << 116) | (instr_ptr_addr << 76) | (func_id << 52)
 
 def jump_fproc_i(func_id, value, alu_op, instr_ptr_addr):
-    opcode = (opcodes['jump_fproc_i'] << 3) + alu_opcodes[alu_op]
-    return (opcode << 120) + (value << 88) + (instr_ptr_addr << 76) + (func_id << 52)
+    return opcode_prefixes[('jump_fproc_i', alu_op)] | (value << 88) | (instr_ptr_addr << 76) | (func_id << 52)
 
 def alu_cmd(optype, im_or_reg, alu_in0, alu_op=None, alu_in1=0, write_reg_addr=None, jump_cmd_ptr=None, func_id=None):
     """
@@ -302,35 +334,32 @@ def alu_cmd(optype, im_or_reg, alu_in0, alu_op=None, alu_in1=0, write_reg_addr=N
         func_id : int
     """
     cmd = 0
-    if optype in ['reg_alu', 'jump_cond']: #these have alu_in1 from reg
-        cmd += alu_in1 << 84
-    if optype in ['alu_fproc', 'jump_fproc']:
+    if optype in ('reg_alu', 'jump_cond'): #these have alu_in1 from reg
+        cmd |= alu_in1 << 84
+    if optype in ('alu_fproc', 'jump_fproc'):
         if func_id is not None:
-            cmd += func_id << 52
-    if optype in ['jump_cond', 'jump_fproc']:
-        cmd += jump_cmd_ptr << 68
-    if optype in ['reg_alu', 'alu_fproc']:
-        cmd += write_reg_addr << 80
+            cmd |= func_id << 52
+    if optype in ('jump_cond', 'jump_fproc'):
+        cmd |= jump_cmd_ptr << 68
+    if optype in ('reg_alu', 'alu_fproc'):
+        cmd |= write_reg_addr << 80
     if optype == 'inc_qclk':
         assert alu_op is None or alu_op == 'add'
         alu_op = 'add'
 
     if im_or_reg == 'i':
         opkey = optype + '_i'
-        cmd += twos_complement(alu_in0) << 88
+        cmd |= twos_complement(alu_in0) << 88
     else:
         opkey = optype
-        cmd += alu_in0 << 116
-
-    opcode = (opcodes[opkey] << 3) + alu_opcodes[alu_op]
-    cmd += opcode << 120
+        cmd |= alu_in0 << 116
 
-    return cmd
+    return cmd | opcode_prefixes[(opkey, alu_op)]
 
 def idle(cmd_time):
     cmd = cmd_time << pulse_field_pos['cmd_time']
     assert cmd_time < 2**pulse_field_widths['cmd_time']
-    cmd += opcodes['idle'] << 123
+    cmd |= opcodes['idle'] << 123
     return cmd
 
 def done_cmd():
@@ -340,7 +369,7 @@ def pulse_reset():
     return opcodes['pulse_reset'] << 123
 
 def sync(barrier_id):
-    return (opcodes['sync'] << 123) + (barrier_id << 112)
+    return (opcodes['sync'] << 123) | (barrier_id << 112)
 
 def twos_complement(value, nbits=32):
     """
@@ -356,25 +385,21 @@ def twos_complement(value, nbits=32):
     -------
         int or list of ints
     """
+    if isinstance(value, int):
+        if not -(1 << (nbits - 1)) <= value < (1 << (nbits - 1)):
+            raise Exception('{} out of range'.format(value))
+        return value & ((1 << nbits) - 1)
+
     if isinstance(value, list) or isinstance(value, np.ndarray):
-        value_array = np.array(value)
+        value_array = np.asarray(value)
     else:
         value_array = np.array([value])
 
-    if np.any((value_array > (2**(nbits-1) - 1)) | (value_array < (-2**(nbits-1)))):
+    if value_array.size and (value_array.max() > 2**(nbits-1) - 1 or value_array.min() < -2**(nbits-1)):
         raise Exception('{} out of range'.format(value))
 
-    posmask = value_array >= 0
-    negmask = value_array < 0
-
-    value_array[negmask] = 2**nbits + value_array[negmask]
-
-    if np.any(value_array) < 0:
-        raise Exception('Overflow, probably related to input dtype')
-
-    if isinstance(value, int):
-        return int(value_array[0])
-    else:
-        return value_array
+    if value_array.dtype.kind in 'iu':
+        return value_array.astype(np.int64, copy=False) & ((1 << nbits) - 1)
+    return np.where(value_array < 0, value_array + 2**nbits, value_array)
 
 
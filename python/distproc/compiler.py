@@ -116,12 +116,7 @@ import parse
 import re
 from attrs import define
 
-try:
-    import ipdb
-except ImportError:
-    logging.warning('failed to import ipdb')
 import json
-from collections import OrderedDict
 
 import qubitconfig.qchip as qc
 import distproc.assembler as asm
@@ -13,7 +13,6 @@ import qubitconfig.qchip as qc
 import logging
 import distproc.hwconfig as hw
 import distproc.ir.instructions as iri
-import ipdb
 
 @define
 class _Frequency:
@@ -292,6 +291,7 @@ class QubitScoper:
 
     def __init__(self, mapping=('{qubit}.qdrv', '{qubit}.rdrv', '{qubit}.rdlo')):
         self._mapping = mapping
+        self._mapping_parsers = tuple(parse.compile(chan_pattern) for chan_pattern in mapping)
 
     def get_scope(self, qubits):
         if isinstance(qubits, str):
@@ -299,7 +299,7 @@ class QubitScoper:
 
         channels = ()
         for qubit in qubits:
-            if any(parse.parse(chan_pattern, qubit) for chan_pattern in self._mapping):
+            if any(parser.parse(qubit) for parser in self._mapping_parsers):
                 qubit_chans = (qubit,)
             else:
                 qubit_chans = tuple(chan.format(qubit=qubit) for chan in self._mapping)
@@ -338,10 +338,12 @@ class CoreScoper:
 
     def _generate_proc_groups(self, proc_grouping):
         proc_groupings = {}
+        group_parsers = [(group, tuple(parse.compile(dest_pattern) for dest_pattern in group))
+                         for group in proc_grouping]
         for dest in self._dest_channels:
-            for group in proc_grouping:
-                for dest_pattern in group:
-                    sub_dict = parse.parse(dest_pattern, dest)
+            for group, parsers in group_parsers:
+                for parser in parsers:
+                    sub_dict = parser.parse(dest)
                     if sub_dict is not None:
                         proc_groupings[dest] = tuple(pattern.format(**sub_dict.named) for pattern in group)
 
@@ -1,6 +1,6 @@
 from attrs import define, field
-from collections import OrderedDict
 import numpy as np
+import math
 import copy
 import networkx as nx
 import parse
@@ -10,13 +10,12 @@ import logging
 import distproc.hwconfig as hw
 import distproc.ir.instructions as iri
 from distproc.ir.ir import Pass, CoreScoper, QubitScoper, IRProgram
-import ipdb
 
 class FlattenProgram(Pass):
     """
     Generates an intermediate representation with control flow resolved into simple 
-    conditional jump statements. This function is recursive to allow for nested control 
-    flow structures.
+    conditional jump statements. Nested control flow structures are flattened using an 
+    explicit stack, so nesting depth isn't limited by the python recursion limit.
 
     instruction format is the same as compiler input, with the following modifications:
 
@@ -60,16 +59,35 @@ class FlattenProgram(Pass):
         ir_prog.control_flow_graph.nodes[blockname]['instructions'] = self._flatten_control_flow(instructions)
 
     def _flatten_control_flow(self, program, label_prefix=''):
+        # each _flatten_block generator yields the (sub-block, prefix) it needs flattened 
+        # and gets the result sent back; run them off of an explicit stack instead of recursing
+        stack = [self._flatten_block(program, label_prefix)]
+        result = None
+        while stack:
+            try:
+                subblock = stack[-1].send(result)
+            except StopIteration as done:
+                stack.pop()
+                result = done.value
+                continue
+            stack.append(self._flatten_block(*subblock))
+            result = None
+
+        return result
+
+    def _flatten_block(self, program, label_prefix):
         flattened_program = []
         branchind = 0
         for i, statement in enumerate(program):
-            statement = copy.deepcopy(statement)
             if statement.name in ['branch_fproc', 'branch_var']:
+                # control statements are only read from; nested statements get copied as leaves
                 falseblock = statement.false
                 trueblock = statement.true
+                statement = copy.copy(statement)
+                statement.scope = copy.deepcopy(statement.scope)
     
-                flattened_trueblock = self._flatten_control_flow(trueblock, label_prefix='true_'+label_prefix)
-                flattened_falseblock = self._flatten_control_flow(falseblock, label_prefix='false_'+label_prefix)
+                flattened_trueblock = yield trueblock, 'true_'+label_prefix
+                flattened_falseblock = yield falseblock, 'false_'+label_prefix
     
                 jump_label_false = '{}false_{}'.format(label_prefix, branchind)
                 jump_label_end = '{}end_{}'.format(label_prefix, branchind)
@@ -103,7 +121,9 @@ class FlattenProgram(Pass):
     
             elif statement.name == 'loop':
                 body = statement.body
-                flattened_body = self._flatten_control_flow(body, label_prefix='loop_body_'+label_prefix)
+                statement = copy.copy(statement)
+                statement.scope = copy.deepcopy(statement.scope)
+                flattened_body = yield body, 'loop_body_'+label_prefix
                 loop_label = '{}loop_{}_loopctrl'.format(label_prefix, branchind)
     
                 flattened_program.append(iri.JumpLabel(label=loop_label, scope=statement.scope))
@@ -119,7 +139,7 @@ class FlattenProgram(Pass):
                 statement = statement.copy()
     
             else:
-                flattened_program.append(statement)
+                flattened_program.append(copy.deepcopy(statement))
     
         return flattened_program
 
@@ -212,13 +232,13 @@ class ScopeProgram(Pass):
                 if hasattr(instr, 'scope') and instr.scope is not None:
                     instr_scope = self._scoper.get_scope(instr.scope)
                     instr.scope = instr_scope
-                    scope = scope.union(instr_scope)
+                    scope.update(instr_scope)
                 elif hasattr(instr, 'qubit') and instr.qubit is not None:
                     instr_scope = self._scoper.get_scope(instr.qubit)
                     instr.scope = instr_scope
-                    scope = scope.union(instr_scope)
+                    scope.update(instr_scope)
                 elif hasattr(instr, 'dest'):
-                    scope = scope.union(self._scoper.get_scope(instr.dest))
+                    scope.update(self._scoper.get_scope(instr.dest))
     
             ir_prog.control_flow_graph.nodes[node]['scope'] = scope
 
@@ -226,12 +246,13 @@ class ScopeProgram(Pass):
             self._rescope_barriers_and_delays(ir_prog)
 
     def _rescope_barriers_and_delays(self, ir_prog: IRProgram):
+        prog_scope = ir_prog.scope # union over all blocks; compute once instead of per instruction
         for node in ir_prog.blocks:
             block = ir_prog.blocks[node]['instructions']
             for instr in block:
                 if instr.name == 'barrier' or instr.name == 'delay' or instr.name == 'idle':
                     if instr.scope is None:
-                        instr.scope = ir_prog.scope
+                        instr.scope = prog_scope.copy()
 
 class RegisterVarsAndFreqs(Pass):
     """
@@ -306,6 +327,8 @@ class ResolveGates(Pass):
         self._scoper = QubitScoper(qubit_grouping)
     
     def run_pass(self, ir_prog: IRProgram):
+        # pulses are only read below, so unmodified gates can share one get_pulses() result
+        gate_pulses = {}
         for node in ir_prog.blocks:
             block = ir_prog.blocks[node]['instructions']
 
@@ -315,12 +338,16 @@ class ResolveGates(Pass):
                     # remove gate instruction from block and decrement index
                     instr = block.pop(i)
 
-                    gate = self._qchip.gates[''.join(instr.qubit) + instr.name]
+                    gatename = f"{''.join(instr.qubit)}{instr.name}"
                     if instr.modi is not None:
-                        gate = gate.get_updated_copy(instr.modi)
-                    gate.dereference()
-
-                    pulses = gate.get_pulses()
+                        gate = self._qchip.gates[gatename].get_updated_copy(instr.modi)
+                        gate.dereference()
+                        pulses = gate.get_pulses()
+                    else:
+                        # get_pulses already returns copies; don't dereference (rewrite) the shared qchip gate
+                        if gatename not in gate_pulses:
+                            gate_pulses[gatename] = self._qchip.gates[gatename].get_pulses()
+                        pulses = gate_pulses[gatename]
 
                     block.insert(i, iri.Barrier(scope=self._scoper.get_scope(instr.qubit)))
                     i += 1
@@ -656,20 +683,21 @@ class Schedule(Pass):
 
 
     def _schedule_block(self, instructions, cur_t, last_instr_end_t):
+        proc_groupings = self._core_scoper.proc_groupings
+        pulse_load_clks = self._fpga_config.pulse_load_clks
         i = 0
         while i < len(instructions):
             instr = instructions[i]
             if instr.name == 'pulse':
-                last_instr_t = last_instr_end_t[self._core_scoper.proc_groupings[instr.dest]]
-                instr.start_time = max(last_instr_t, cur_t[instr.dest])
+                grp = proc_groupings[instr.dest]
+                instr.start_time = max(last_instr_end_t[grp], cur_t[instr.dest])
 
-                last_instr_end_t[self._core_scoper.proc_groupings[instr.dest]] = instr.start_time \
-                        + self._fpga_config.pulse_load_clks
+                last_instr_end_t[grp] = instr.start_time + pulse_load_clks
                 cur_t[instr.dest] = instr.start_time + self._get_pulse_nclks(instr.twidth)
 
             elif instr.name == 'barrier':
                 max_cur_t = max(cur_t[dest] for dest in instr.scope)
-                max_last_instr_t = max(last_instr_end_t[self._core_scoper.proc_groupings[dest]] for dest in instr.scope)
+                max_last_instr_t = max(last_instr_end_t[proc_groupings[dest]] for dest in instr.scope)
                 max_t = max(max_cur_t, max_last_instr_t)
                 for dest in instr.scope:
                     cur_t[dest] = max_t
@@ -677,8 +705,9 @@ class Schedule(Pass):
                 i -= 1
 
             elif instr.name == 'delay':
+                delay_nclks = self._get_pulse_nclks(instr.t)
                 for dest in instr.scope:
-                    cur_t[dest] += self._get_pulse_nclks(instr.t)
+                    cur_t[dest] += delay_nclks
                 instructions.pop(i)
                 i -= 1
 
@@ -715,7 +744,7 @@ class Schedule(Pass):
                         logging.getLogger(__name__).info(f'skipping hold on core {grp}, idle timestamp exceeded')
                     else:
                         idle_instr_scope = idle_instr_scope.union(grp)
-                        last_instr_end_t[grp] = idle_end_t + self._fpga_config.pulse_load_clks
+                        last_instr_end_t[grp] = idle_end_t + pulse_load_clks
 
                 if len(idle_instr_scope) > 0:
                     instructions[i] = iri.Idle(idle_end_t, scope=idle_instr_scope)
@@ -727,7 +756,7 @@ class Schedule(Pass):
                 max_end_t = max(last_instr_end_t[grp] for grp in self._core_scoper.get_groups_bydest(instr.scope))
                 instr.t = max_end_t
                 for grp in self._core_scoper.get_groups_bydest(instr.scope):
-                    last_instr_end_t[grp] = max_end_t + self._fpga_config.pulse_load_clks
+                    last_instr_end_t[grp] = max_end_t + pulse_load_clks
 
             elif isinstance(instr, iri.Gate):
                 raise Exception('Must resolve gates first!')
@@ -735,7 +764,7 @@ class Schedule(Pass):
             i += 1
 
     def _get_pulse_nclks(self, length_secs):
-        return int(np.ceil(length_secs/self._fpga_config.fpga_clk_period))
+        return math.ceil(length_secs/self._fpga_config.fpga_clk_period)
 
 
     def _check_nodename_loopstart(self, nodename):
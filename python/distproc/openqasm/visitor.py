@@ -29,7 +29,6 @@ from openqasm3.visitor import QASMVisitor, QASMNode
 import openqasm3.ast as ast
 from distproc.openqasm.qubit_map import QubitMap, DefaultQubitMap
 from distproc.openqasm.gate_map import GateMap, DefaultGateMap
-import ipdb
 import warnings
 from attrs import define
 
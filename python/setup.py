@@ -31,8 +31,9 @@ setuptools.setup(
 	package_data={
 		"": ["*.json"],
 		},
-	extra_requires={
+	extras_require={
 		"numpy": ['numpy>1.20'],
+		"xxhash": ['xxhash'],
 		},
 	install_requires=[
         #"qubic",
@@ -1,7 +1,7 @@
 import pytest
 import numpy as np
-import ipdb
 import distproc.assembler as asm 
+import distproc.command_gen as cg
 import distproc.compiler as cm
 import distproc.hwconfig as hw
 import qubitconfig.qchip as qc
@@ -64,6 +64,136 @@ def test_prog_fromlist():
     assert np.all(np.asarray(envpr[0]) == np.asarray(envfl[0]))
     assert np.all(np.asarray(freqpr) == np.asarray(freqfl))
 
+def test_pulse_phase_amp_regs():
+    asmprog = asm.SingleCoreAssembler([ElementConfig(), ElementConfig(), ElementConfig()])
+    asmprog.add_reg_write('phase', np.pi, ('phase', 1))
+    asmprog.add_reg_write('amp', 0.5, ('amp', 1))
+    asmprog.add_pulse(100e6, 'phase', 'amp', 15, np.arange(10)/11., 1)
+    cmd_buf, _, _ = asmprog.get_compiled_program()
+
+    # only one pulse param can come from a register per instruction, so phase is written first
+    phase_cmd = int.from_bytes(cmd_buf[32:48], 'little')
+    assert phase_cmd == cg.pulse_cmd(phase_regaddr=asmprog._regs['phase']['index'], cfg_word=1)
+
+def test_compiled_prog_cache():
+    asmprog = asm.SingleCoreAssembler([ElementConfig(), ElementConfig(), ElementConfig()])
+    asmprog.add_phase_reset()
+    asmprog.add_pulse(100e6, 0.5, 0.9, 15, np.arange(10)/11., 0)
+    cmd_buf, env_raw, freq_raw = asmprog.get_compiled_program()
+    assert asmprog.get_compiled_program() == (cmd_buf, env_raw, freq_raw)
+
+    asmprog.add_done_stb()
+    cmd_buf_done, _, _ = asmprog.get_compiled_program()
+    assert cmd_buf_done[:len(cmd_buf)] == cmd_buf
+    assert int.from_bytes(cmd_buf_done[len(cmd_buf):], 'little') == cg.done_cmd()
+
+def test_env_freq_buffer_cache():
+    asmprog = asm.SingleCoreAssembler([ElementConfig()])
+    asmprog.add_pulse(100e6, 0.5, 0.9, 15, np.arange(10)/11., 0)
+    asmprog.get_compiled_program()
+    env_freq_buffers = asmprog._env_freq_buffers
+
+    asmprog.add_pulse(100e6, 0.2, 0.5, 30, np.arange(10)/11., 0)
+    asmprog.get_compiled_program()
+    assert asmprog._env_freq_buffers is env_freq_buffers
+
+    asmprog.add_pulse(200e6, 0.2, 0.5, 45, np.arange(10)/11., 0)
+    assert asmprog._env_freq_buffers is None
+
+def test_env_edit_after_compile():
+    class ScaledEnvConfig(ElementConfig):
+        def get_env_buffer(self, env_samples):
+            return (np.asarray(env_samples)*1000).astype(int)
+
+    def compile_prog(env, edit_env=False):
+        asmprog = asm.SingleCoreAssembler([ScaledEnvConfig()])
+        asmprog.add_env('e', env, 0)
+        asmprog.add_pulse(100e6, 0.5, 0.9, 15, 'e', 0)
+        asmprog.add_pulse(100e6, 0.5, 0.9, 30, env, 0)
+        asmprog.get_compiled_program()
+        if edit_env:
+            env[:] = 0
+        asmprog.add_phase_reset()
+        _, env_raw, _ = asmprog.get_compiled_program()
+        asmprog.add_freq(200e6, 0) # forces the env buffers to be rebuilt
+        _, env_raw_rebuilt, _ = asmprog.get_compiled_program()
+        assert env_raw_rebuilt == env_raw
+        return env_raw
+
+    env = np.arange(10)/11.
+    env_raw = compile_prog(env.copy())
+    assert compile_prog(env, edit_env=True) == env_raw
+
+def test_sim_program_copy():
+    asmprog = asm.SingleCoreAssembler([ElementConfig()])
+    asmprog.add_phase_reset()
+    asmprog.add_pulse(100e6, 0.5, 0.9, 15, np.arange(10)/11., 0)
+    asmprog.add_done_stb()
+    compiled_prog = asmprog.get_compiled_program()
+
+    sim_prog = asmprog.get_sim_program()
+    assert isinstance(sim_prog[1]['env'], np.ndarray)
+    for cmd in sim_prog:
+        cmd['op'] = 'pulse_reset'
+    assert asmprog.get_compiled_program() == compiled_prog
+    assert [cmd['op'] for cmd in asmprog.get_sim_program()] == ['pulse_reset', 'pulse', 'done_stb']
+
+def test_declare_reg():
+    asmprog = asm.SingleCoreAssembler([ElementConfig()])
+    for i in range(asm.N_MAX_REGS):
+        asmprog.declare_reg('r{}'.format(i))
+        assert asmprog._regs['r{}'.format(i)]['index'] == i
+
+    with pytest.raises(Exception, match='already declared'):
+        asmprog.declare_reg('r3')
+    with pytest.raises(Exception, match='limit'):
+        asmprog.declare_reg('r{}'.format(asm.N_MAX_REGS))
+
+def test_env_dedup():
+    asmprog = asm.SingleCoreAssembler([ElementConfig()])
+    asmprog.add_env('env0', np.arange(8)/9., 0)
+    asmprog.add_env('env1', np.arange(8)/9., 0)
+    asmprog.add_pulse(100e6, 0, 0.5, 5, 'env1', 0)
+    asmprog.add_pulse(100e6, 0, 0.5, 10, np.arange(8)/9., 0)
+    env_raw, env_word_map = asmprog._get_env_buffer(0)
+
+    assert len(env_raw) == 8
+    assert len(set(env_word_map.values())) == 1
+
+def test_env_key_dtype_shape():
+    asmprog = asm.SingleCoreAssembler([ElementConfig()])
+    asmprog.add_pulse(100e6, 0, 0.5, 5, np.zeros(8), 0)
+    asmprog.add_pulse(100e6, 0, 0.5, 10, np.zeros(16, dtype=np.float32), 0)
+    asmprog.add_pulse(100e6, 0, 0.5, 15, np.zeros((2, 4)), 0)
+    asmprog.add_pulse(100e6, 0, 0.5, 20, np.zeros(8), 0)
+    assert len(asmprog._env_dicts[0]) == 3
+
+def test_env_buffer_no_rehash():
+    asmprog = asm.SingleCoreAssembler([ElementConfig()])
+    asmprog.add_env('env0', np.arange(8)/9., 0)
+    asmprog.add_pulse(100e6, 0, 0.5, 10, np.arange(8)/9., 0)
+    asmprog.add_pulse(100e6, 0, 0.5, 20, np.arange(4)/9., 0)
+
+    def fail_hash(env):
+        raise AssertionError('env rehashed while building buffer')
+    asmprog._hash_env = fail_hash
+    env_raw, env_word_map = asmprog._get_env_buffer(0)
+
+    assert len(env_raw) == 12
+    assert len(env_word_map) == 3
+
+def test_add_freq_ind():
+    asmprog = asm.SingleCoreAssembler([ElementConfig()])
+    asmprog.add_freq(100e6, 0)
+    asmprog.add_freq(300e6, 0, freq_ind=3)
+    assert asmprog._freq_lists[0] == [100e6, None, None, 300e6]
+
+    asmprog.add_freq(200e6, 0, freq_ind=2)
+    assert asmprog._freq_lists[0] == [100e6, None, 200e6, 300e6]
+
+    with pytest.raises(ValueError):
+        asmprog.add_freq(400e6, 0, freq_ind=3)
+
 def test_compiled_prog():
     prog = []
     prog.append({'op':'phase_reset'})
@@ -0,0 +1,42 @@
+import pytest
+import distproc.command_gen as cg
+
+def field_mask(pos, width):
+    return ((1 << width) - 1) << pos
+
+def assert_disjoint(fields):
+    masks = [field_mask(pos, width) for pos, width in fields]
+    for i in range(len(masks)):
+        for j in range(i + 1, len(masks)):
+            assert masks[i] & masks[j] == 0
+
+def test_pulse_fields_disjoint():
+    # each pulse parameter is followed by its write enable (+ reg mux) bits
+    ctrl_bits = {'cmd_time': 0, 'cfg': 1, 'amp': 2, 'freq': 2, 'phase': 2, 'env_word': 2}
+    fields = [(cg.pulse_field_pos[key], cg.pulse_field_widths[key] + ctrl_bits[key]) for key in ctrl_bits]
+    fields.append((116, 4)) #pulse param reg addr
+    fields.append((123, 5)) #opcode
+    assert_disjoint(fields)
+
+def test_alu_fields_disjoint():
+    opcode = (120, 8)
+    ival = (88, 32)
+    in0_reg = (116, 4)
+    in1_reg = (84, 4)
+    write_reg = (80, 4)
+    jump_addr = (68, 8)
+    assert_disjoint([opcode, ival, in1_reg, write_reg])
+    assert_disjoint([opcode, in0_reg, in1_reg, write_reg])
+    assert_disjoint([opcode, ival, in1_reg, jump_addr])
+    assert_disjoint([opcode, in0_reg, in1_reg, jump_addr])
+
+    assert cg.reg_alu_i(-1, 'zero', 15, 15) == cg.opcode_prefixes[('reg_alu_i', 'zero')] \
+            | field_mask(*ival) | field_mask(*in1_reg) | field_mask(*write_reg)
+    assert cg.jump_cond_i(-1, 'ge', 15, 255) == cg.opcode_prefixes[('jump_cond_i', 'ge')] \
+            | field_mask(*ival) | field_mask(*in1_reg) | field_mask(*jump_addr)
+
+def test_reg_opcodes():
+    assert cg.reg_alu(3, 'add', 4, 5) == cg.alu_cmd('reg_alu', 'r', 3, 'add', 4, write_reg_addr=5)
+    assert cg.jump_cond(3, 'le', 4, 200) == cg.alu_cmd('jump_cond', 'r', 3, 'le', 4, jump_cmd_ptr=200)
+    assert cg.reg_alu_i(-7, 'sub', 4, 5) == cg.alu_cmd('reg_alu', 'i', -7, 'sub', 4, write_reg_addr=5)
+    assert cg.jump_cond_i(-7, 'eq', 4, 200) == cg.alu_cmd('jump_cond', 'i', -7, 'eq', 4, jump_cmd_ptr=200)
@@ -1,6 +1,5 @@
 import pytest
 import numpy as np
-import ipdb
 import distproc.compiler as cm
 import distproc.ir.ir as ir
 import distproc.ir.passes as ps
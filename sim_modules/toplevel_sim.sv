@@ -67,12 +67,14 @@ module toplevel_sim#(
     assign pulse_reset = pulseout.reset;
 
     //this just breaks the input 128-bit cmd_write into 4 separate chunks and writes simultaneously
+    //named so that testbenches can reach the memory arrays (cmd_mem_bank[i].mem.data)
     genvar i;
-    generate for(i = 0; i < MEM_TO_CMD; i = i + 1) 
+    generate for(i = 0; i < MEM_TO_CMD; i = i + 1) begin : cmd_mem_bank
         cmd_mem #(.CMD_WIDTH(MEM_WIDTH), .ADDR_WIDTH(CMD_ADDR_WIDTH), .READ_LATENCY(MEM_READ_LATENCY)) 
             mem(.clk(clk), .write_enable(cmd_write_enable), .cmd_in(cmd_write[MEM_WIDTH*(i+1)-1:MEM_WIDTH*i]), 
             .write_address(cmd_write_addr), .read_address(memif.instr_ptr), 
             .cmd_out(memif.mem_bus[i]));
+    end
     endgenerate
 
 endmodule